@@ -4,12 +4,18 @@
 # Author: Ervin Kurbegovic
 
 import pdb
-from time import sleep
+from time import sleep, monotonic
 from datetime import datetime
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
 import pandas as pd
 import json
 import re
+import hashlib
+import unicodedata
+import zlib
 import psycopg2
 from psycopg2 import sql, errors
 from sqlalchemy import create_engine, text
@@ -26,6 +32,80 @@ import socket
 
 #load_dotenv(override=True)
 
+# Class for low-overhead progress reporting and structured run logs.
+class SyncProgress:
+    """
+    The SyncProgress class reports the progress of long running Jamf|School requests without printing one line per request.
+    Aggregate counters are redrawn in place at most every `interval` seconds, per-operation results are buffered
+    and appended in batches of `batch_size` to a JSON Lines log file (one JSON object per line).
+
+    In quiet mode nothing is written to the terminal, the log file is still written. Intended for unattended runs.
+    """
+
+    def __init__(self, log_path=None, quiet=False, interval=0.5, batch_size=200):
+        self.log_path = log_path
+        self.quiet = quiet
+        self.interval = interval
+        self.batch_size = batch_size
+        self._buffer = []
+        self.start('', 0)
+
+    # Method to reset the counters for a new phase, e.g. "Sync" or "Delete users".
+    def start(self, phase: str, total: int):
+        self.phase = phase
+        self.total = total
+        self.ok = 0
+        self.errors = 0
+        self._started = monotonic()
+        self._last_draw = 0.0
+
+    # Method to record the result of a single request. Redraws the counters only if the interval has passed.
+    def record(self, operation: str, name, ok: bool, status=None, detail=None):
+        if ok:
+            self.ok += 1
+        else:
+            self.errors += 1
+        self._buffer.append({'time': datetime.now().isoformat(timespec='seconds'), 'phase': self.phase, 'operation': operation,
+                             'name': str(name), 'ok': ok, 'status': status, 'detail': detail})
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+        now = monotonic()
+        if now - self._last_draw >= self.interval:
+            self._draw(now)
+
+    # Method to print a message unless quiet mode is active.
+    def message(self, *text):
+        if not self.quiet:
+            print(*text)
+
+    # Method to close a phase: final redraw, summary and flush of the remaining log entries.
+    def finish(self):
+        self._draw(monotonic())
+        self.flush()
+        if not self.quiet:
+            sys.stdout.write('\n')
+            if self.errors > 0 and self.log_path:
+                print(f"{self.errors} errors in {self.phase}, details in {self.log_path}")
+
+    # Method to append the buffered results to the log file.
+    def flush(self):
+        if self._buffer and self.log_path:
+            try:
+                with open(self.log_path, 'a', encoding='utf-8') as log_file:
+                    log_file.write(''.join([json.dumps(entry, default=str) + '\n' for entry in self._buffer]))
+            except OSError as ex:
+                print('Writing the log file failed:', ex)
+        self._buffer = []
+
+    def _draw(self, now):
+        self._last_draw = now
+        if self.quiet:
+            return
+        done = self.ok + self.errors
+        rate = done / max(now - self._started, 1e-6)
+        sys.stdout.write(f"\r{self.phase}: {done} of {self.total} - ok {self.ok} - errors {self.errors} - {rate:.1f}/s")
+        sys.stdout.flush()
+
 # Class and methods for authentication and converting API data to DataFrames.
 class JamfAPI:
     """
@@ -45,8 +125,11 @@ class JamfAPI:
         - Username: Devices > Enroll Devices > MDM Server URL ...network=****...
     """
 
+    # Default run log, built once per process so all JamfAPI objects of a session append to the same file
+    default_log_path = f"jamfsync_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.jsonl"
+
     # Constructor: Initializes the object
-    def __init__(self, username: str, password: str, api_url: str, endpoint='all', teacher_group='lehrkraefte', teacher_role='ROLE_TEACHER'):
+    def __init__(self, username: str, password: str, api_url: str, endpoint='all', teacher_group='lehrkraefte', teacher_role='ROLE_TEACHER', max_workers=8, quiet=False, log_path=None):
         if not username:
             raise ValueError("username argument is required")
         if not password:
@@ -64,6 +147,14 @@ class JamfAPI:
         self.reset_color = '\033[0m' # reset color
         self.engine = create_engine('postgresql://postgres@:5432/iserv')
         self.session = requests.Session()
+        # Shared connection pool for parallel user and class requests
+        self.max_workers = max_workers
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_workers))
+        # Progress reporting and structured run log (JSON Lines), quiet mode for unattended runs
+        self.quiet = quiet
+        if log_path is None:
+            log_path = JamfAPI.default_log_path
+        self.progress = SyncProgress(log_path=log_path, quiet=quiet)
         self.headers = {
                         'User-Agent': 'curl/7.24.0',
                         'X-Server-Protocol-Version':'3',
@@ -100,120 +191,38 @@ class JamfAPI:
         except BaseException as ex:
           sys.exit(ex)
 
-    def sync_jamf_data(self, endpoint: str, location: str):
+    def sync_jamf_data(self, endpoint: str, location: str, suffix='', praefix=''):
         if not endpoint:
             raise ValueError("Endpoint argument is required")
         if not location:
             raise ValueError("Location argument is required")
         try:
-            location_id = str(df_loc[df_loc['name'] == location]['id'].values[0])
+            location_id = str(self._location_id(location))
             if endpoint == 'users':
-                df_loc = self.locations
-                if df_loc.empty:
-                    raise ValueError("DataFrame is empty")
-                location_id = str(df_loc[df_loc['name'] == location]['id'].values[0])
-                url = self.endpoints['users'][0]
                 isv_users = self._get_iserv_data('iserv_users')
-                isv_students = self._get_iserv_data('iserv_students')
-                isv_teachers = self._get_iserv_data('iserv_teachers')
-                student_pretty_act = ", ".join([student for student in isv_students['act']])
-                teacher_pretty_act = ", ".join([teacher for teacher in isv_teachers['act']])
-                print(student_pretty_act)
-                print('-----'*10)
-                print('STUDENTS:', len(isv_students))
-                input('\nEnter to sync...')
-                os.system('clear')
-                # FOR-Loop for creating users in jamf based on provided IServ data
-                result_students = {'ids':[], 'username':[]}
-                for counter, (index, data) in enumerate(isv_students.iterrows()):
-                    user = data['act']
-                    data = {
-                        "username": data['act'],
-                        "password": "", # empty
-                        "email": data['email'], # intern comment important only for citeq@School: For email addresses (fol/foe indicators), update user data instead of overwriting it.
-                        "firstName": data["firstname"],
-                        "lastName": data['lastname'],
-                        "memberOf": data['actgrp'],
-                        "locationId": location_id,
-                        "notes": "automatisch generierte Benutzer auf Basis der IServ-Benuter."
-                        }
-                    response = self.session.post(url, headers=self.headers, json=data, auth=(self.username, self.password))
-                    # Check response status code to ensure successful request transmission (expected: 2xx code).
-                    if response.status_code == 200:
-                        print(f"{user} created - Progress {counter+1} of {len(isv_students)}")
-                        result_students['ids'].append(json.loads(response.text)['id'])
-                        result_students['username'].append(user)
-                    else:
-                        print(f"Error creating students: {response.status_code} - {response.text}")
-                os.system('clear')
-                print(teacher_pretty_act)
-                print('-----'*10)
-                print('TEACHERS:', len(isv_teachers))
-                input('\nEnter to sync...')
-                os.system('clear')
-                result_teachers = {'ids':[], 'username':[], 'groups':[]}
-                for counter, (index, data) in enumerate(isv_teachers.iterrows()):
-                    user = data['act']
-                    teacher_groups = data['actgrp']
-                    data = {   
-                        "username": data['act'],
-                        "password": "", # empty
-                        "email": data['email'], # intern comment important only for citeq@School: For email addresses (fol/foe indicators), update user data instead of over>
-                        "firstName": data["firstname"],
-                        "lastName": data['lastname'],
-                        "memberOf": [],
-                        "locationId": location_id,
-                        "notes": "automatisch generierte Benutzer auf Basis der IServ-Benuter."
-                        }
-                    response = self.session.post(url, headers=self.headers, json=data, auth=(self.username, self.password))
-                    # Check response status code to ensure successful request transmission (expected: 2xx code).
-                    if response.status_code == 200:
-                        print(f"{user} created - Progress {counter+1} of {len(isv_teachers)}")
-                        result_teachers['ids'].append(json.loads(response.text)['id'])
-                        result_teachers['username'].append(user)
-                        result_teachers['groups'].append(teacher_groups)
-                    else:
-                        print(f"Error creating teacher: {response.status_code} - {response.text}")
-                self._creat_classes(class_template=result_teachers)
             elif endpoint == 'teachers':
-                isv_teachers = self._get_iserv_data('iserv_teachers')
-                teacher_pretty_act = ", ".join([teacher for teacher in isv_teachers['act']])
-                print(teacher_pretty_act)
-                print('-----'*10)
-                print('TEACHERS:', len(isv_teachers))
+                isv_users = self._get_iserv_data('iserv_teachers')
+            else:
+                raise ValueError(f"Unknown endpoint: {endpoint}")
+            isv_students = isv_users.loc[isv_users['teacher'] == False]
+            isv_teachers = isv_users.loc[isv_users['teacher'] == True]
+            isv_groups_to_sync = self._get_iserv_data('iserv_groups')['act'].to_list()
+            self.progress.message('STUDENTS:', len(isv_students), '- TEACHERS:', len(isv_teachers), '- CLASSES:', len(isv_groups_to_sync))
+            self.progress.message('-----'*10)
+            if not self.quiet:
                 input('\nEnter to sync...')
-                os.system('clear')
-                result_teachers = {'ids':[], 'username':[], 'groups':[]}
-                for counter, (index, data) in enumerate(isv_teachers.iterrows()):
-                    user = data['act']
-                    teacher_groups = data['actgrp']
-                    data = {   
-                        "username": data['act'],
-                        "password": "", # empty
-                        "email": data['email'], # intern comment important only for citeq@School: For email addresses (fol/foe indicators), update user data instead of over>
-                        "firstName": data["firstname"],
-                        "lastName": data['lastname'],
-                        "memberOf": [],
-                        "locationId": location_id,
-                        "notes": "automatisch generierte Benutzer auf Basis der IServ-Benuter."
-                        }
-                    response = self.session.post(url, headers=self.headers, json=data, auth=(self.username, self.password))
-                    # Check response status code to ensure successful request transmission (expected: 2xx code).
-                    if response.status_code == 200:
-                        print(f"{user} created - Progress {counter+1} of {len(isv_teachers)}")
-                        result_teachers['ids'].append(json.loads(response.text)['id'])
-                        result_teachers['username'].append(user)
-                        result_teachers['groups'].append(teacher_groups)
-                    else:
-                        print(f"Error creating teacher: {response.status_code} - {response.text}")
-                self._creat_classes(class_template=result_teachers)
+            return self._sync_users_and_classes(location_id, isv_users, isv_groups_to_sync, suffix=suffix, praefix=praefix)
         except Exception as e:
-            print(e)
+            # Own phase for the failure, a phase started by _sync_users_and_classes is already finished
+            self.progress.start('Sync', 0)
+            self.progress.record('sync', location, False, None, f"{e.__class__.__name__}: {e}")
+            self.progress.flush()
+            self.progress.message(f"\n{self.red}Sync failed: {e}{self.reset_color}")
 
     # **WARNING:** This method deletes all users in Jamf. Proceed with extreme caution.
     def delete_users(self, location='all', only_iserv_users=True):
         df_users = self.users
-        print(f'Starting the Deletion of Users')
+        self.progress.message('Starting the Deletion of Users')
         if location == 'all':
             df_users = df_users.loc[(df_users['locationId'] >= 0)]
         else:
@@ -221,7 +230,7 @@ class JamfAPI:
             location_id = str(df_loc[df_loc['name'] == location]['id'].values[0])
             df_users = df_users.loc[(df_users['locationId'] == int(location_id))]
         if df_users.empty:
-            print('No users in Jamf. Deletion of users stopped!')
+            self.progress.message('No users in Jamf. Deletion of users stopped!')
             return None
         else:
             if only_iserv_users == True:
@@ -231,23 +240,25 @@ class JamfAPI:
                 user_uuids = df_users['id'].to_list()
                 user_names = df_users['name'].to_list()
             # Delete all instances using a for loop
-            print(F"Following {len(user_names)} users noted: ", user_names)
-            print('-----'*15)
+            self.progress.message(f"Following {len(user_names)} users noted for deletion.")
+            self.progress.message('-----'*15)
             sleep(3)
             session = requests.Session()
+            self.progress.start('Delete users', len(user_uuids))
             for counter, uuid in enumerate(user_uuids):
                 url = self.endpoints['users'][0] + f"/{uuid}"
                 response = session.delete(url, headers=self.headers, auth=(self.username, self.password))
                 # Check response status code to ensure successful request transmission (expected: 2xx code).
                 if response.status_code == 200:
-                    print(f"User with id {uuid} deleted - Progress {counter+1} of {len(user_uuids)}")
+                    self.progress.record('delete_user', user_names[counter], True, response.status_code, uuid)
                 else:
-                    print(f"Error deleting User: {user_names[counter]} - {response.status_code} - {response.text}")
+                    self.progress.record('delete_user', user_names[counter], False, response.status_code, response.text)
+            self.progress.finish()
             session.close()
 
     # **WARNING:** This method deletes all classes in Jamf. Proceed with extreme caution.
     def delete_classes(self, location='all', only_iserv_classes=True):
-        print('Starting the Deletion of Classes')
+        self.progress.message('Starting the Deletion of Classes')
         df_classes = self.classes
         if df_classes.empty:
             self.delete_classes()
@@ -260,7 +271,7 @@ class JamfAPI:
             location_id = str(df_loc[df_loc['name'] == location]['id'].values[0])
             df_classes = df_classes.loc[(df_classes['locationId'] == int(location_id))]
         if df_classes.empty:
-            print('No classes in Jamf. Deletion of classes stopped!')
+            self.progress.message('No classes in Jamf. Deletion of classes stopped!')
             return None
         else:
             if only_iserv_classes == True:
@@ -270,53 +281,148 @@ class JamfAPI:
                 class_uuids = df_classes['uuid'].to_list()
                 class_names = df_classes['name'].to_list()
             # Delete all instances using a for loop
-            print(f"Following {len(class_names)} classes noted: ", class_names)
-            print('-----'*15)
+            self.progress.message(f"Following {len(class_names)} classes noted for deletion.")
+            self.progress.message('-----'*15)
             sleep(3)
             if 'klassen entfernen!' == 'klassen entfernen!':
                 session = requests.Session()
+                self.progress.start('Delete classes', len(class_uuids))
                 for counter, uuid in enumerate(class_uuids):
                     url = self.endpoints['classes'][0] + f"/{uuid}"
                     response = session.delete(url, headers=self.headers, auth=(self.username, self.password))
                     # Check response status code to ensure successful request transmission (expected: 2xx code).
                     if response.status_code == 200:
-                        print(f"Class with uuid {uuid} deleted - Progress {counter+1} of {len(class_uuids)}")
+                        self.progress.record('delete_class', class_names[counter], True, response.status_code, uuid)
                     else:
-                        print(f"Error deleting class: {cl} - {response.status_code} - {response.text}")
+                        self.progress.record('delete_class', class_names[counter], False, response.status_code, response.text)
+                self.progress.finish()
                 session.close()
             else:
-                print('Deletion canceled. Classes still available.')
+                self.progress.message('Deletion canceled. Classes still available.')
 
-    def _create_classes(self, class_template: dict, suffix='', praefix=''):
-        df_loc = self.locations
-        location_id = str(df_loc[df_loc['name'] == location]['id'].values[0])
-        isv_groups_to_sync = self._get_iserv_data('iserv_groups')
-        pretty_classes = ", ".join([group for group in isv_groups_to_sync])
-        print(pretty_classes)
-        print('-----'*10)
-        print('Classes:', len(isv_groups_to_sync))
-        input('\nEnter to sync...')
-        os.system('clear')
-        for counter, cl in enumerate(isv_groups_to_sync):
-            url = self.endpoints['classes'][0]
-            data = {
-                "name": f"{praefix}{cl}{suffix}",
-                "description":"automatisch generierte Klasse auf Basis der IServ-Gruppen.",
-                "teachers": [],
-                "locationId": location_id
-            }
+    def _sync_users_and_classes(self, location_id: str, isv_users, isv_groups: list, suffix='', praefix=''):
+        '''
+        Method to create users and classes in one dependency-driven pipeline.
+        A class depends only on the Jamf ids of its own members. It is posted as soon as the last of its members created in this run
+        has been answered, so user and class requests overlap on the shared connection pool instead of waiting for the slowest user.
+        Members which are not part of this run are resolved with the ids already known in Jamf. Failed user requests still release their classes.
+        Classes that already exist in the location (same name incl. praefix/suffix) are updated by their uuid instead of being created again.
 
-            if 'klasse' in str(cl).lower():
-                data["teachers"] = class_template[1]
-            else:
-                data["teachers"] = ready_class_data[cl]['teacher_ids']
-            response = session.post(url, headers=self.headers, json=data, auth=(self.username, self.password))
+        Args:
+            location_id (str, required): Jamf location id of the users and classes.
+            isv_users (DataFrame, required): IServ users as returned by `_get_iserv_data('iserv_users')`.
+            isv_groups (list, required): Names of the IServ groups that are synced as classes.
+            suffix (str, optional): Suffix of the class names. Defaults to ''.
+            praefix (str, optional): Praefix of the class names. Defaults to ''.
 
-            if response.status_code == 200:
-                print(f"{cl} created - Progress {counter+1} of {len(ready_class_data.keys())}")
-            else:
-                print(f"Error creating classes: {cl} - {response.status_code} - {response.text}")
-        session.close()
+        Returns:
+            dict: {'students': {...}, 'teachers': {...}, 'classes': {...}}
+        '''
+        url_users = self.endpoints['users'][0]
+        url_classes = self.endpoints['classes'][0]
+        auth = (self.username, self.password)
+        known_ids = {} if self.users.empty else dict(zip(self.users['username'], self.users['id']))
+        members, teachers = self._class_members(isv_users, isv_groups)
+        existing_classes = {}
+        if not self.classes.empty:
+            df_cl = self.classes.loc[self.classes['locationId'] == int(location_id)]
+            existing_classes = dict(zip(df_cl['name'], df_cl['uuid']))
+        # Dependencies: members of a class that are created in this run
+        isv_rows = {data['act']: data for index, data in isv_users.iterrows()}
+        waiting = {cl: members[cl] & isv_rows.keys() for cl in members}
+        dependents = {}
+        for cl, users in waiting.items():
+            for user in users:
+                dependents.setdefault(user, []).append(cl)
+        # Users are queued class by class, so the members of a class are answered together and release it early
+        user_queue = deque()
+        queued = set()
+        for user in [user for cl in isv_groups for user in sorted(waiting[cl])] + list(isv_rows):
+            if user not in queued:
+                queued.add(user)
+                user_queue.append(user)
+        # Classes without members of this run can start right away
+        class_queue = deque([cl for cl, users in waiting.items() if not users])
+        results = {'students': {'ids':[], 'username':[]},
+                   'teachers': {'ids':[], 'username':[], 'groups':[]},
+                   'classes': {'uuids':[], 'name':[]}}
+        futures = {}
+        self.progress.start('Sync', len(isv_users) + len(isv_groups))
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while futures or user_queue or class_queue:
+                    # At most max_workers requests in flight, ready classes are sent ahead of queued users
+                    while len(futures) < self.max_workers and (class_queue or user_queue):
+                        if class_queue:
+                            cl = class_queue.popleft()
+                            data = {
+                                "name": f"{praefix}{cl}{suffix}",
+                                "description":"automatisch generierte Klasse auf Basis der IServ-Gruppen.",
+                                "students": [known_ids[user] for user in sorted(members[cl] - teachers) if user in known_ids],
+                                "teachers": [known_ids[user] for user in sorted(members[cl] & teachers) if user in known_ids],
+                                "locationId": location_id
+                            }
+                            uuid = existing_classes.get(data['name'])
+                            if uuid is None:
+                                futures[executor.submit(self.session.post, url_classes, headers=self.headers, json=data, auth=auth)] = ('create_class', cl)
+                            else:
+                                futures[executor.submit(self.session.put, url_classes + f"/{uuid}", headers=self.headers, json=data, auth=auth)] = ('update_class', cl)
+                        else:
+                            user = user_queue.popleft()
+                            row = isv_rows[user]
+                            data = {
+                                "username": row['act'],
+                                "password": "", # empty
+                                "email": row['email'], # intern comment important only for citeq@School: For email addresses (fol/foe indicators), update user data instead of overwriting it.
+                                "firstName": row["firstname"],
+                                "lastName": row['lastname'],
+                                "memberOf": [] if row['teacher'] else row['actgrp'],
+                                "locationId": location_id,
+                                "notes": "automatisch generierte Benutzer auf Basis der IServ-Benuter."
+                                }
+                            futures[executor.submit(self.session.post, url_users, headers=self.headers, json=data, auth=auth)] = ('user', user)
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        kind, name = futures.pop(future)
+                        # Check response status code to ensure successful request transmission (expected: 2xx code).
+                        ok, status, detail = False, None, None
+                        try:
+                            response = future.result()
+                            status, detail = response.status_code, response.text
+                            if response.status_code == 200:
+                                if kind == 'user':
+                                    detail = json.loads(response.text)['id']
+                                elif kind == 'create_class':
+                                    detail = json.loads(response.text)['uuid']
+                                else:
+                                    detail = existing_classes[f"{praefix}{name}{suffix}"]
+                                ok = True
+                        except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as ex:
+                            detail = f"{ex.__class__.__name__}: {ex}"
+                        if kind == 'user':
+                            self.progress.record('create_user', name, ok, status, detail)
+                            if ok:
+                                known_ids[name] = detail
+                                if name in teachers:
+                                    results['teachers']['ids'].append(detail)
+                                    results['teachers']['username'].append(name)
+                                    results['teachers']['groups'].append(isv_rows[name]['actgrp'])
+                                else:
+                                    results['students']['ids'].append(detail)
+                                    results['students']['username'].append(name)
+                            # Failed users release their classes as well
+                            for cl in dependents.pop(name, []):
+                                waiting[cl].discard(name)
+                                if not waiting[cl]:
+                                    class_queue.append(cl)
+                        else:
+                            self.progress.record(kind, name, ok, status, detail)
+                            if ok:
+                                results['classes']['uuids'].append(detail)
+                                results['classes']['name'].append(name)
+        finally:
+            self.progress.finish()
+        return results
 
     def create_user_template(self, initial_sync=False, location=None, fresh_users = None):
         if location == None:
@@ -445,6 +551,133 @@ class JamfAPI:
         all_teacher_ids = jamf_users.loc[jamf_users['username'].isin(teacher_list)]['id'].to_list()
         return [class_dict, all_teacher_ids]
 
+    def review_users(self, location: str, buckets=256, only_iserv_data=True, suffix='', praefix=''):
+        '''
+        Method to audit the drift between IServ and Jamf|School, e.g. as a nightly consistency check after a sync run.
+        Users and classes of both systems are normalized and hashed into per-location buckets. Only the buckets whose
+        fingerprints differ are compared record by record, so an unchanged state is confirmed without a full diff.
+        Classes are compared by their number of students and teachers only. A member swapped for another one keeps the counts
+        and is not reported; changed class sizes are reported as differing.
+
+        Args:
+            location (str, required): Name of the Jamf location the IServ data is synced to.
+            buckets (int, optional): Number of buckets per location. Defaults to 256.
+            only_iserv_data (boolean, optional): Only audit Jamf users and classes generated by Jamfsync. Defaults to True.
+            suffix (str, optional): Suffix of the class names as used by `sync_jamf_data`. Defaults to ''.
+            praefix (str, optional): Praefix of the class names as used by `sync_jamf_data`. Defaults to ''.
+
+        Returns:
+            dict: {'users': {'missing': list, 'extra': list, 'differing': list}, 'classes': {...}}
+        '''
+        if not location:
+            raise ValueError("Location argument is required")
+        location_id = self._location_id(location)
+        isv_users = self._get_iserv_data('iserv_users')
+        isv_groups = self._get_iserv_data('iserv_groups')['act'].to_list()
+        members, teachers = self._class_members(isv_users, isv_groups)
+        jamf_users = self.users
+        jamf_classes = self.classes
+        if not jamf_users.empty:
+            jamf_users = jamf_users.loc[jamf_users['locationId'] == location_id]
+            if only_iserv_data == True:
+                jamf_users = jamf_users[jamf_users['notes'] == 'automatisch generierte Benutzer auf Basis der IServ-Benuter.']
+        if not jamf_classes.empty:
+            jamf_classes = jamf_classes.loc[jamf_classes['locationId'] == location_id]
+            if only_iserv_data == True:
+                jamf_classes = jamf_classes[jamf_classes['description'] == 'automatisch generierte Klasse auf Basis der IServ-Gruppen.']
+        # Normalized records: (location_id, key) -> tuple of compared fields
+        isv_user_records = {(location_id, self._normalize_record_value(act, key=True)): (self._normalize_record_value(first), self._normalize_record_value(last), self._normalize_record_value(mail, key=True))
+                            for act, first, last, mail in zip(isv_users['act'], isv_users['firstname'], isv_users['lastname'], isv_users['email'])}
+        jamf_user_records = {}
+        if not jamf_users.empty:
+            jamf_user_records = {(int(loc), self._normalize_record_value(name, key=True)): (self._normalize_record_value(first), self._normalize_record_value(last), self._normalize_record_value(mail, key=True))
+                                 for loc, name, first, last, mail in zip(jamf_users['locationId'], jamf_users['username'], jamf_users['firstName'], jamf_users['lastName'], jamf_users['email'])}
+        isv_class_records = {(location_id, self._normalize_record_value(f"{praefix}{cl}{suffix}", key=True)): (str(len(members[cl] - teachers)), str(len(members[cl] & teachers)))
+                             for cl in isv_groups}
+        jamf_class_records = {}
+        if not jamf_classes.empty:
+            jamf_class_records = {(int(loc), self._normalize_record_value(name, key=True)): (str(int(students)), str(int(teachers_count)))
+                                  for loc, name, students, teachers_count in zip(jamf_classes['locationId'], jamf_classes['name'], jamf_classes['studentCount'], jamf_classes['teacherCount'])}
+        report = {'users': self._compare_records(isv_user_records, jamf_user_records, buckets),
+                  'classes': self._compare_records(isv_class_records, jamf_class_records, buckets)}
+        # Summary on the terminal, the drifting records go to the run log
+        for kind, drift in report.items():
+            if drift['missing'] or drift['extra'] or drift['differing']:
+                self.progress.message(f"{self.red}{kind.capitalize()} drift in {location}: missing {len(drift['missing'])} - extra {len(drift['extra'])} - differing {len(drift['differing'])}{self.reset_color}")
+                self.progress.start(f"Review {kind}", len(drift['missing']) + len(drift['extra']) + len(drift['differing']))
+                for name in drift['missing']:
+                    self.progress.record(f"review_{kind}", name, False, 'missing')
+                for name in drift['extra']:
+                    self.progress.record(f"review_{kind}", name, False, 'extra')
+                for entry in drift['differing']:
+                    self.progress.record(f"review_{kind}", entry['key'], False, 'differing', {'iserv': entry['iserv'], 'jamf': entry['jamf']})
+                self.progress.finish()
+            else:
+                message = f"{kind.capitalize()} are consistent in {location}"
+                border = '*' * len(message)
+                self.progress.message(f"{border}\n{message}\n{border}")
+        return report
+
+    # Method to look up the Jamf id of a location by its name.
+    def _location_id(self, location: str):
+        df_loc = self.locations
+        if df_loc.empty or location not in df_loc['name'].to_list():
+            raise ValueError(f"Unknown location: {location}")
+        return int(df_loc[df_loc['name'] == location]['id'].values[0])
+
+    # Method to determine the IServ members of each synced class. Classes ("klasse") additionally get all teachers.
+    def _class_members(self, isv_users, isv_groups: list):
+        teachers = set(isv_users.loc[isv_users['teacher'] == True]['act'])
+        members = {cl: set() for cl in isv_groups}
+        for user, groups in zip(isv_users['act'], isv_users['actgrp']):
+            for group in groups:
+                if group in members:
+                    members[group].add(user)
+        for cl in members:
+            if 'klasse' in str(cl).lower():
+                members[cl] |= teachers
+        return members, teachers
+
+    # Method to compare two record sets bucket by bucket and drill down only into buckets with differing fingerprints.
+    def _compare_records(self, isv_records: dict, jamf_records: dict, buckets=256):
+        isv_fingerprints, isv_members = self._fingerprint_buckets(isv_records, buckets)
+        jamf_fingerprints, jamf_members = self._fingerprint_buckets(jamf_records, buckets)
+        drift = {'missing': [], 'extra': [], 'differing': []}
+        for bucket in isv_fingerprints.keys() | jamf_fingerprints.keys():
+            if isv_fingerprints.get(bucket) == jamf_fingerprints.get(bucket):
+                continue
+            for key in isv_members.get(bucket, set()) | jamf_members.get(bucket, set()):
+                if key not in jamf_records:
+                    drift['missing'].append(key[1])
+                elif key not in isv_records:
+                    drift['extra'].append(key[1])
+                elif isv_records[key] != jamf_records[key]:
+                    drift['differing'].append({'key': key[1], 'iserv': isv_records[key], 'jamf': jamf_records[key]})
+        drift['missing'].sort()
+        drift['extra'].sort()
+        drift['differing'].sort(key=lambda entry: entry['key'])
+        return drift
+
+    # Method to build per-location, per-bucket fingerprints. The bucket only depends on the record key, the fingerprint
+    # on key and fields. XOR-combined digests are independent of the record order.
+    def _fingerprint_buckets(self, records: dict, buckets=256):
+        fingerprints = {}
+        members = {}
+        for (location_id, key), fields in records.items():
+            bucket = (location_id, zlib.crc32(key.encode('utf-8')) % buckets)
+            digest = hashlib.blake2b('\x1f'.join((key,) + fields).encode('utf-8'), digest_size=8).digest()
+            count, combined = fingerprints.get(bucket, (0, 0))
+            fingerprints[bucket] = (count + 1, combined ^ int.from_bytes(digest, 'big'))
+            members.setdefault(bucket, set()).add((location_id, key))
+        return fingerprints, members
+
+    # Method to normalize a single value of a user or class record. Keys (usernames, emails, class names) are compared case-insensitive.
+    def _normalize_record_value(self, value, key=False):
+        if value is None or (isinstance(value, float) and value != value):
+            return ''
+        value = ' '.join(unicodedata.normalize('NFC', str(value)).split())
+        return value.casefold() if key else value
+
     # Method to retrieve data from the local database iserv
     def _get_iserv_data(self, data='all', teacher_group='lehrkraefte'):
         try:
@@ -18,19 +18,39 @@ import string, random
 import sys
 import os
 import traceback
+import argparse
 from jamfsync import JamfAPI
 
 def main():
+    parser = argparse.ArgumentParser(description='Jamfsync: sync IServ users and groups to Jamf|School')
+    parser.add_argument('-a', '--action', choices=['sync', 'review'], default=None, help='run the sync or the drift audit once without the interactive menu')
+    parser.add_argument('--location', default='LABOR Citeq', help='Jamf location used by --action (default: LABOR Citeq)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='no progress output and no confirmation prompts, requires --action (unattended runs)')
+    parser.add_argument('-l', '--log', default=None, help='path of the JSON Lines run log (default: jamfsync_<timestamp>.jsonl)')
+    args = parser.parse_args()
+    if args.quiet and args.action is None:
+        parser.error('--quiet requires --action, the interactive menu cannot run unattended')
     # Load secure global variables to avoid using usernames and passwords in plain text
     apiuser = os.getenv('APIUSERNAME2')
     apipwd = os.getenv('APIPASSWORD2')
     api_url = "https://laborciteqms.jamfcloud.com/api/"
+    # Non-interactive run: sync or audit once and exit, the exit code is 1 on failed requests or drift
+    if args.action is not None:
+        jamf = JamfAPI(username=apiuser, password=apipwd, api_url=api_url, endpoint='all', quiet=args.quiet, log_path=args.log)
+        if args.action == 'sync':
+            result = jamf.sync_jamf_data('users', args.location)
+            if result is None or jamf.progress.errors > 0:
+                sys.exit(1)
+        elif args.action == 'review':
+            report = jamf.review_users(args.location)
+            if any(drift['missing'] or drift['extra'] or drift['differing'] for drift in report.values()):
+                sys.exit(1)
+        return
     pruef = True
     while pruef:
         os.system('clear')
-        jamf = JamfAPI(username=apiuser, password=apipwd, api_url=api_url, endpoint='all') #If the endpoint is set to None, all endpoints are queried
+        jamf = JamfAPI(username=apiuser, password=apipwd, api_url=api_url, endpoint='all', log_path=args.log) #If the endpoint is set to None, all endpoints are queried
         engine = create_engine('postgresql://postgres@:5432/iserv')
-        jamf.sync_jamf_data('users', 'LABOR Citeq')
         red = '\033[31m'
         red_end = '\033[0m'
         pruef = True
@@ -51,9 +71,12 @@ def main():
         location_name = mylocations['locations'][x_loc][1] # name
         print('Location:\t', location_name, '\nLocation_ID:\t', location_key)
         print('-----'*12,'\n')
-        i = input('Jamfsync Options:\n(d)elete - (c)reate - (v)iew - (u)pdate - (r)eview - (q)uit\n\nIhre Eingabe: ')
+        i = input('Jamfsync Options:\n(s)ync - (d)elete - (c)reate - (v)iew - (u)pdate - (r)eview - (q)uit\n\nIhre Eingabe: ')
         os.system('clear')
-        if i == 'd':
+        if i == 's':
+            jamf.sync_jamf_data('users', location_name)
+            input()
+        elif i == 'd':
             x = input('Deleting Options:\n(u)sers or (c)lasses or (a)ll\n\nIhre Eingabe: ')
             os.system('clear')
             if x == 'c':
@@ -149,7 +172,8 @@ def main():
                         if len(api_data['add']) > 0:
                             fresh_user_keys = [item.keys() for item in api_data['add']]
                             all_keys = [key for sublist in fresh_user_keys for key in sublist]
-                            fresh = jamf.review_users()
+                            isv_users = jamf._get_iserv_data('iserv_users')
+                            fresh = isv_users.loc[isv_users['email'].isin(all_keys)]
                             jamf.update_users(user_template=api_data, location=location_name, fresh_users=fresh)
                     elif len(api_data['delete']) > 0:
                         jamf.update_users(user_template=api_data, location=location_name)
@@ -161,6 +185,7 @@ def main():
                     jamf.update_classes(location=location_name)
         elif i == 'r':
             jamf.review_users(location_name)
+            input()
         elif i == 'q':
             pruef = False
 